@@ -5,6 +5,7 @@ from math import cos, inf, pi, sin
 
 from Box2D import b2Contact, b2ContactListener, b2Vec2, b2World
 from reviewlogger import Logger
+from wmr_terrain import MAX_CHUNK_PLATFORMS, Terrain, TerrainStreamer
 
 Position = tuple[float, float]
 
@@ -58,6 +59,17 @@ SENSOR_COLOR = COLOR_ROYAL_BLUE
 VIS_CHASSIS_WIDTH = 3.25
 VIS_WHEEL_THICKNESS = 0.8
 
+# Adaptive stepping (see WMR.advance): coarse substeps are used in free travel,
+# fine substeps (time_step) near obstacles, on contact, or while bouncing
+
+COARSE_STEP_TICKS = 4
+COARSE_VELOCITY_ITERATIONS = 4
+COARSE_POSITION_ITERATIONS = 2
+
+FINE_STEP_MARGIN = 1
+FINE_STEP_ANGULAR_SPEED = 0.5
+FINE_STEP_VERTICAL_SPEED = 0.5
+
 
 class Side(Enum):
     FRONT = 1
@@ -96,23 +108,30 @@ def intersection_distance(p, r, q, s) -> tuple[b2Vec2 | None, float]:
     return i, (i - p).length if i else inf
 
 
+class ContactMode(Enum):
+    # Box2D calls back into Python on every contact event
+    LISTENER = 1
+    # The front wheel's contact edges are read only when queried
+    POLL = 2
+
+
 class ContactCallback(b2ContactListener):
     def __init__(self, tag_a, tag_b):
         super().__init__()
-        self.a = tag_a
-        self.b = tag_b
+        self.tags = {(tag_a, tag_b), (tag_b, tag_a)}
         self.contact = False
 
+    def matches(self, contact: b2Contact) -> bool:
+        # Match both fixture orders
+        bodies = (contact.fixtureA.body.userData, contact.fixtureB.body.userData)
+        return bodies in self.tags
+
     def BeginContact(self, contact: b2Contact):
-        if (contact.fixtureA.body.userData == self.a) and (
-            contact.fixtureB.body.userData == self.b
-        ):
+        if self.matches(contact):
             self.contact = True
 
     def EndContact(self, contact: b2Contact):
-        if (contact.fixtureA.body.userData == self.a) and (
-            contact.fixtureB.body.userData == self.b
-        ):
+        if self.matches(contact):
             self.contact = False
 
 
@@ -128,6 +147,11 @@ class WMR:
         duration: float,
         time_step: float,
         visualize: bool = False,
+        contact_mode: ContactMode = ContactMode.LISTENER,
+        step_height: float = STEP_HEIGHT,
+        wall_position_x: float = WALL_POSITION_X,
+        ground_friction: float = GROUND_FRICTION,
+        terrain_seed: int | None = None,
     ):
         self.chassis_position_init = (WMR_X_OFFSET, wheel_radius + WMR_Y_OFFSET)
 
@@ -136,30 +160,48 @@ class WMR:
         self.chassis_height = min(1, 1.1 * wheel_radius)
         self.sensor_limit = sensor_limit
 
+        self.step_height = step_height
+        self.wall_position_x = wall_position_x
+
         self.angular_velocity = 0
 
         # Create the Box2D world
 
         self.world = b2World(gravity=(0, -9.8))
 
-        # Create the ground
+        if terrain_seed is None:
+            self.terrain = None
 
-        ground = self.world.CreateStaticBody()
-        ground.CreateEdgeFixture(
-            vertices=[(-GROUND_EXTENT, 0), (GROUND_EXTENT, 0)], friction=GROUND_FRICTION
-        )
+            # Create the ground
 
-        # Create the wall
+            ground = self.world.CreateStaticBody(userData="ground")
+            ground.CreateEdgeFixture(
+                vertices=[(-GROUND_EXTENT, 0), (GROUND_EXTENT, 0)],
+                friction=ground_friction,
+            )
 
-        wall = self.world.CreateStaticBody(position=WALL_POSITION)
-        wall.CreateEdgeFixture(vertices=[(0, 0), (0, WALL_HEIGHT)])
+            # Create the wall
 
-        # Create the step
+            wall = self.world.CreateStaticBody(
+                position=(self.wall_position_x, 0), userData="wall"
+            )
+            wall.CreateEdgeFixture(vertices=[(0, 0), (0, WALL_HEIGHT)])
 
-        step = self.world.CreateStaticBody(position=STEP_POSITION)
-        step.CreatePolygonFixture(
-            box=(STEP_LENGTH / 2, STEP_HEIGHT / 2), friction=GROUND_FRICTION
-        )
+            # Create the step
+
+            step = self.world.CreateStaticBody(position=STEP_POSITION, userData="step")
+            step.CreatePolygonFixture(
+                box=(STEP_LENGTH / 2, self.step_height / 2), friction=ground_friction
+            )
+        else:
+            # Generated course ending at the wall, streamed in around the chassis
+            # (the step box is centered on the ground, so it stands only
+            # step_height / 2 tall, and platforms are no taller)
+            self.terrain = Terrain(
+                terrain_seed, self.wall_position_x, self.step_height / 2, WALL_HEIGHT
+            )
+            self.streamer = TerrainStreamer(self.world, self.terrain, ground_friction)
+            self.streamer.update(self.chassis_position_init[0])
 
         # Create the chassis
 
@@ -183,11 +225,13 @@ class WMR:
 
         # Create contact listener for the front wheel and the wall
 
-        wall.userData = "wall"
         self.wheel_front.userData = "wmr"
-        self.world.contactListener = ContactCallback(
-            wall.userData, self.wheel_front.userData
-        )
+
+        self.contact_mode = contact_mode
+        if self.contact_mode == ContactMode.LISTENER:
+            self.world.contactListener = ContactCallback(
+                "wall", self.wheel_front.userData
+            )
 
         # Create the rear wheel
 
@@ -233,6 +277,10 @@ class WMR:
         self.time_step = time_step
         self.time = 0
 
+        # Time is counted in integer ticks of time_step so that it never drifts
+        self.ticks = 0
+        self.num_substeps = 0
+
         self.VELOCITY_ITERATIONS = 8
         self.POSITION_ITERATIONS = 3
 
@@ -265,9 +313,19 @@ class WMR:
             WALL_COLOR,
         )
 
-        self.logger.add_box(
-            "step", STEP_LENGTH, STEP_HEIGHT / 2, self.VIS_STEP_WIDTH, STEP_COLOR
-        )
+        if self.terrain is None:
+            self.logger.add_box(
+                "step",
+                STEP_LENGTH,
+                self.step_height / 2,
+                self.VIS_STEP_WIDTH,
+                STEP_COLOR,
+            )
+        else:
+            # Unit boxes scaled to the platforms in the streamed window
+            self.VIS_NUM_PLATFORMS = MAX_CHUNK_PLATFORMS * TerrainStreamer.max_chunks()
+            for i in range(self.VIS_NUM_PLATFORMS):
+                self.logger.add_box(f"platform_{i}", 1, 1, 1, STEP_COLOR)
 
         self.logger.add_box(
             "chassis",
@@ -319,13 +377,24 @@ class WMR:
         self.logger.new_frame()
 
         # Shift the wall based on its thickness
-        wall_position_x = WALL_POSITION_X + self.VIS_WALL_THICKNESS / 2
+        wall_position_x = self.wall_position_x + self.VIS_WALL_THICKNESS / 2
         self.logger.add_to_frame(
             "wall", (wall_position_x, WALL_HEIGHT / 2, 0), (1, 0, 0, 0)
         )
-        self.logger.add_to_frame(
-            "step", (STEP_POSITION_X, STEP_HEIGHT / 4, 0), (1, 0, 0, 0)
-        )
+        if self.terrain is None:
+            self.logger.add_to_frame(
+                "step", (STEP_POSITION_X, self.step_height / 4, 0), (1, 0, 0, 0)
+            )
+        else:
+            platforms = self.terrain.platforms(*self.streamer.extent())
+            for i in range(self.VIS_NUM_PLATFORMS):
+                if i < len(platforms):
+                    start, end, height = platforms[i]
+                    p = ((start + end) / 2, height / 2, 0)
+                    s = (end - start, height, self.VIS_STEP_WIDTH)
+                else:
+                    p, s = (0, 0, 0), (0, 0, 0)
+                self.logger.add_to_frame(f"platform_{i}", p, (1, 0, 0, 0), s)
 
         angle = self.chassis.angle
 
@@ -377,39 +446,82 @@ class WMR:
         sensor_tip = sensor_base + self.sensor_limit * b2Vec2(cos(angle), sin(angle))
         sensor = sensor_tip - sensor_base
 
-        wall_base = b2Vec2(WALL_POSITION_X, 0)
-        wall_top = b2Vec2(WALL_POSITION_X, WALL_HEIGHT)
-        wall = wall_top - wall_base
-
-        wall_intersection, wall_distance = intersection_distance(
-            sensor_base, sensor, wall_base, wall
-        )
-
-        ground_base = b2Vec2(0, 0)
-        ground_end = b2Vec2(GROUND_EXTENT, 0)
-        ground = ground_end - ground_base
-
-        ground_intersection, ground_distance = intersection_distance(
-            sensor_base, sensor, ground_base, ground
+        self.tip_position = sensor_tip
+        self.sensor_distance = self.sensor_limit
+
+        for segment_base, segment_end in self.sensor_segments(sensor_base, sensor_tip):
+            segment = segment_end - segment_base
+            segment_intersection, segment_distance = intersection_distance(
+                sensor_base, sensor, segment_base, segment
+            )
+            if segment_intersection and segment_distance < self.sensor_distance:
+                self.tip_position = segment_intersection
+                self.sensor_distance = segment_distance
+
+    def sensor_segments(
+        self, sensor_base: b2Vec2, sensor_tip: b2Vec2
+    ) -> list[tuple[b2Vec2, b2Vec2]]:
+        if self.terrain is None:
+            return [
+                (
+                    b2Vec2(self.wall_position_x, 0),
+                    b2Vec2(self.wall_position_x, WALL_HEIGHT),
+                ),
+                (b2Vec2(0, 0), b2Vec2(GROUND_EXTENT, 0)),
+            ]
+
+        # Only the segments in the sensor's bounding box
+        segments = self.terrain.segments(
+            min(sensor_base.x, sensor_tip.x),
+            max(sensor_base.x, sensor_tip.x),
+            min(sensor_base.y, sensor_tip.y),
+            max(sensor_base.y, sensor_tip.y),
         )
-
-        if wall_intersection and wall_distance < ground_distance:
-            self.tip_position = wall_intersection
-        elif ground_intersection and ground_distance < self.sensor_limit:
-            self.tip_position = ground_intersection
+        return [(b2Vec2(p), b2Vec2(q)) for p, q in segments]
+
+    def needs_fine_step(self) -> bool:
+        # Close to the step or wall (measured from the wheels' outer edges)
+        x = self.chassis.position.x
+        extent = self.chassis_length / 2 + self.wheel_radius + FINE_STEP_MARGIN
+        if self.terrain is None:
+            obstacles = [
+                STEP_POSITION_X - STEP_LENGTH / 2,
+                STEP_POSITION_X + STEP_LENGTH / 2,
+                self.wall_position_x,
+            ]
         else:
-            self.tip_position = sensor_tip
-
-        self.sensor_distance = min(self.sensor_limit, wall_distance, ground_distance)
+            obstacles = self.terrain.edges(x - extent, x + extent)
+        if any(abs(x - obstacle) < extent for obstacle in obstacles):
+            return True
+
+        # Bouncing or tipping
+        if abs(self.chassis.angularVelocity) > FINE_STEP_ANGULAR_SPEED:
+            return True
+        if abs(self.chassis.linearVelocity.y) > FINE_STEP_VERTICAL_SPEED:
+            return True
+
+        # Touching anything other than the ground
+        return any(
+            edge.contact.touching and edge.other.userData != "ground"
+            for wheel in (self.wheel_front, self.wheel_rear)
+            for edge in wheel.contacts
+        )
 
-    def step(self) -> bool:
+    def substep(
+        self, ticks: int, velocity_iterations: int, position_iterations: int
+    ) -> bool:
         self.world.Step(
-            self.time_step, self.VELOCITY_ITERATIONS, self.POSITION_ITERATIONS
+            ticks * self.time_step, velocity_iterations, position_iterations
         )
 
+        if self.terrain is not None:
+            self.streamer.update(self.chassis.position.x)
+
         self.update_distance_sensor()
 
-        self.time += self.time_step
+        self.ticks += ticks
+        self.num_substeps += 1
+        self.time = self.ticks * self.time_step
 
         if self.visualize and (
             self.time >= self.next_vis_time or self.time >= self.duration
@@ -419,13 +531,54 @@ class WMR:
 
         return self.time >= self.duration
 
+    def step(self) -> bool:
+        return self.substep(1, self.VELOCITY_ITERATIONS, self.POSITION_ITERATIONS)
+
+    def advance(self, period: float) -> bool:
+        # Advance by period (a multiple of time_step), choosing the size of
+        # each substep and the solver iterations as we go
+        end_ticks = self.ticks + round(period / self.time_step)
+
+        while self.ticks < end_ticks:
+            if self.needs_fine_step():
+                ticks = 1
+                velocity_iterations = self.VELOCITY_ITERATIONS
+                position_iterations = self.POSITION_ITERATIONS
+            else:
+                ticks = min(COARSE_STEP_TICKS, end_ticks - self.ticks)
+                velocity_iterations = COARSE_VELOCITY_ITERATIONS
+                position_iterations = COARSE_POSITION_ITERATIONS
+
+            self.substep(ticks, velocity_iterations, position_iterations)
+
+        return self.time >= self.duration
+
     def set_angular_velocity(self, angular_velocity: float):
         self.angular_velocity = angular_velocity
         self.wheel_front_motor.motorSpeed = -angular_velocity
         self.wheel_rear_motor.motorSpeed = -angular_velocity
 
+    def wall_contacts(self) -> list[b2Contact]:
+        # Only the front wheel's few contact edges are visited, regardless of
+        # which fixture is A or B
+        return [
+            edge.contact
+            for edge in self.wheel_front.contacts
+            if edge.other.userData == "wall" and edge.contact.touching
+        ]
+
     def contacting_wall(self) -> bool:
-        return self.world.contactListener.contact
+        if self.contact_mode == ContactMode.LISTENER:
+            return self.world.contactListener.contact
+        return len(self.wall_contacts()) > 0
+
+    def wall_impulse(self) -> float:
+        # Normal impulse applied by the wall during the last step
+        return sum(
+            point.normalImpulse
+            for contact in self.wall_contacts()
+            for point in contact.manifold.points
+        )
 
     def get_visualization(self) -> str:
         if not self.visualize:
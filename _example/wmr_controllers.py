@@ -0,0 +1,72 @@
+from abc import ABC, abstractmethod
+from typing import ClassVar
+
+import numpy as np
+
+# Controllers map sensor readings to wheel angular velocities for a batch of
+# robots at once. Each controller is created from one row of (scaled)
+# parameters per robot, and PARAMETER_MAPPING gives the name and range of
+# each parameter (it is appended to the body genes of the genome).
+
+# Largest sensor limit, used to normalize network inputs
+SENSOR_SCALE = 15
+
+HIDDEN_SIZE = 4
+WEIGHT_LIMIT = 5
+
+
+class Controller(ABC):
+    PARAMETER_MAPPING: ClassVar[dict[str, tuple[float, float]]] = {}
+
+    def __init__(self, params: np.ndarray):
+        self.params = np.atleast_2d(np.asarray(params, dtype=float))
+
+    @abstractmethod
+    def __call__(self, distance: np.ndarray) -> np.ndarray: ...
+
+
+class LinearController(Controller):
+    PARAMETER_MAPPING: ClassVar[dict[str, tuple[float, float]]] = {
+        "speed_max": (0, 10),
+        "speed_slope": (0, 10),
+        "speed_intercept": (-20, 20),
+    }
+
+    def __call__(self, distance: np.ndarray) -> np.ndarray:
+        speed_max, speed_slope, speed_intercept = self.params.T
+        return np.clip(distance * speed_slope + speed_intercept, -speed_max, speed_max)
+
+
+class MLPController(Controller):
+    # One hidden layer: speed = speed_max * tanh(w2 · tanh(w1 x + b1) + b2)
+    PARAMETER_MAPPING: ClassVar[dict[str, tuple[float, float]]] = {
+        "speed_max": (0, 10),
+        **{
+            f"{name}_{i}": (-WEIGHT_LIMIT, WEIGHT_LIMIT)
+            for name in ["hidden_weight", "hidden_bias", "output_weight"]
+            for i in range(HIDDEN_SIZE)
+        },
+        "output_bias": (-WEIGHT_LIMIT, WEIGHT_LIMIT),
+    }
+
+    def __init__(self, params: np.ndarray):
+        super().__init__(params)
+
+        n = HIDDEN_SIZE
+        self.speed_max = self.params[:, 0]
+        self.hidden_weight = self.params[:, 1 : 1 + n]
+        self.hidden_bias = self.params[:, 1 + n : 1 + 2 * n]
+        self.output_weight = self.params[:, 1 + 2 * n : 1 + 3 * n]
+        self.output_bias = self.params[:, 1 + 3 * n]
+
+    def __call__(self, distance: np.ndarray) -> np.ndarray:
+        x = np.asarray(distance)[:, np.newaxis] / SENSOR_SCALE
+        hidden = np.tanh(x * self.hidden_weight + self.hidden_bias)
+        output = np.sum(hidden * self.output_weight, axis=1) + self.output_bias
+        return self.speed_max * np.tanh(output)
+
+
+CONTROLLERS = {
+    "linear": LinearController,
+    "mlp": MLPController,
+}
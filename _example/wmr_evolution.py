@@ -1,13 +1,28 @@
 import json
-from argparse import ArgumentParser
+from argparse import ArgumentParser, ArgumentTypeError
 from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
 from math import inf
 from operator import indexOf
 from random import choice, gauss, random, sample, seed
 
+import numpy as np
 import pandas as pd
+import wmr_kinematic
 from enlighten import get_manager
-from wmr import WMR
+from wmr import GROUND_FRICTION, STEP_HEIGHT, WALL_POSITION_X, WMR, ContactMode
+from wmr_controllers import CONTROLLERS, Controller
+from wmr_novelty import NoveltyArchive
+from wmr_optimizers import CMAES, Optimizer
+from wmr_transport import Handle, TrajectoryRing, attached
+
+
+def positive_int(value: str) -> int:
+    number = int(value)
+    if number < 1:
+        raise ArgumentTypeError(f"must be at least 1, got {number}")
+    return number
+
 
 arg_parser = ArgumentParser("Run an evolutionary algorithm to optimize a WMR.")
 
@@ -15,6 +30,25 @@ arg_parser.add_argument("name", type=str)
 arg_parser.add_argument("--population_size", type=int, default=100)
 arg_parser.add_argument("--num_generations", type=int, default=100)
 arg_parser.add_argument("--seed", type=int, default=47)
+arg_parser.add_argument("--num_scenarios", type=int, default=1)
+arg_parser.add_argument("--racing_quantile", type=float, default=0.5)
+arg_parser.add_argument("--prefilter", action="store_true")
+arg_parser.add_argument("--stepping", choices=["fixed", "adaptive"], default="fixed")
+arg_parser.add_argument(
+    "--export", choices=["best", "top_k", "pareto", "elites"], default="best"
+)
+arg_parser.add_argument("--export_k", type=positive_int, default=5)
+arg_parser.add_argument("--workers", type=int, default=1)
+arg_parser.add_argument("--controller", choices=CONTROLLERS.keys(), default="linear")
+arg_parser.add_argument("--batch_size", type=int, default=10)
+arg_parser.add_argument("--trajectories", action="store_true")
+arg_parser.add_argument("--novelty", action="store_true")
+arg_parser.add_argument("--novelty_k", type=int, default=15)
+arg_parser.add_argument("--archive_size", type=int, default=100_000)
+arg_parser.add_argument("--optimizer", choices=["ga", "cmaes"], default="ga")
+arg_parser.add_argument("--target", type=float, default=None)
+arg_parser.add_argument("--terrain_seed", type=int, default=None)
+arg_parser.add_argument("--course_length", type=float, default=None)
 
 args = arg_parser.parse_args()
 
@@ -24,22 +58,28 @@ Genome = list[float]
 Fitness = namedtuple("Fitness", ["feasibility", "objective"])
 Individual = tuple[Genome, Fitness]
 Population = list[Individual]
+Scenario = namedtuple(
+    "Scenario",
+    ["step_height", "wall_position_x", "ground_friction", "terrain_seed"],
+    defaults=[None],
+)
 
 
 # Set default to -inf since we want to maximize
 DEFAULT_FITNESS = Fitness(-inf, -inf)
 
-GENOME_MAPPING = {
+BODY_MAPPING = {
     "wheel_radius": (0.5, 1.5),
     "chassis_length": (1, 4),
     "suspension_frequency": (1, 8),
     "suspension_damping": (0.3, 0.9),
     "sensor_limit": (1, 15),
-    "speed_max": (0, 10),
-    "speed_slope": (0, 10),
-    "speed_intercept": (-20, 20),
 }
 
+# The controller's parameters follow the body genes
+CONTROLLER = CONTROLLERS[args.controller]
+GENOME_MAPPING = BODY_MAPPING | CONTROLLER.PARAMETER_MAPPING
+
 DURATION = 20
 TIME_STEP = 0.01
 CONTROL_STEP = 0.1
@@ -47,8 +87,30 @@ CONTROL_STEP = 0.1
 TARGET_LOCATION = 20
 INITIAL_TARGET_DISTANCE = 17
 
+# Scenarios are evaluated in this order (the first is the nominal course)
+SCENARIOS = [
+    Scenario(STEP_HEIGHT, WALL_POSITION_X, GROUND_FRICTION),
+    Scenario(1.6, WALL_POSITION_X, GROUND_FRICTION),
+    Scenario(STEP_HEIGHT, 22, GROUND_FRICTION),
+    Scenario(STEP_HEIGHT, WALL_POSITION_X, 0.4),
+    Scenario(0.8, 28, GROUND_FRICTION),
+    Scenario(STEP_HEIGHT, 28, 1.0),
+    Scenario(1.6, 22, 0.4),
+    Scenario(0.8, WALL_POSITION_X, 1.0),
+]
+
+# Largest objective an individual can earn in a single scenario
+MAX_OBJECTIVE = 2 + 1 + 0.5 + 0.25 + 0.25
+
 SPEED_TOLERANCE = 0.05
 
+# Kinematic runs that never get this close to the target are rejected (Box2D
+# robots coast up to ~5.5 m further than kinematic ones, which stop at once)
+PREFILTER_MARGIN = 6
+
+# Grid cell size of the novelty archive (behaviors are roughly in [0, 1])
+NOVELTY_CELL_SIZE = 0.1
+
 STAGNATION_LIMIT = 100
 
 MUTATION_RATE = 1 / len(GENOME_MAPPING)
@@ -56,6 +118,8 @@ MUTATION_SCALE = 0.08
 
 TOURNAMENT_SIZE = 3
 
+CMAES_SIGMA = 0.2
+
 
 def clamp(lo: float, hi: float, value: float) -> float:
     return max(lo, min(hi, value))
@@ -76,89 +140,120 @@ def fitness_key(ind: Individual) -> Fitness:
     return ind[1]
 
 
-def simulate(
-    wheel_radius: float,
-    chassis_length: float,
-    suspension_frequency: float,
-    suspension_damping: float,
-    sensor_limit: float,
-    speed_max: float,
-    speed_slope: float,
-    speed_intercept: float,
-    visualize=False,
-) -> dict:
-    wmr = WMR(
-        wheel_radius=wheel_radius,
-        chassis_length=chassis_length,
-        suspension_frequency=suspension_frequency,
-        suspension_damping=suspension_damping,
-        sensor_limit=sensor_limit,
-        duration=DURATION,
-        time_step=TIME_STEP,
-        visualize=visualize,
-    )
+def scenarios() -> list[Scenario]:
+    # With a terrain seed each scenario gets its own generated course (its
+    # platforms are no taller than the scenario's step and the wall ends it)
+    selected = SCENARIOS[: args.num_scenarios]
+    if args.terrain_seed is None:
+        return selected
+    return [
+        scenario._replace(
+            wall_position_x=args.course_length or scenario.wall_position_x,
+            terrain_seed=args.terrain_seed + s,
+        )
+        for s, scenario in enumerate(selected)
+    ]
 
-    next_control_time = 0.0
 
-    NUM_STEPS = int(DURATION / TIME_STEP) + 1
+def decode(genomes: list[Genome]) -> np.ndarray:
+    # Scale genomes to actual values (one row per genome)
+    lo, hi = np.array(list(GENOME_MAPPING.values())).T
+    return scale(0, 1, lo, hi, np.array(genomes, ndmin=2))
 
-    sim_info = {
-        "distance": [],
-        "speed": [],
-        "contact": [],
-        "location": [],
-        "visualization": None,
-    }
 
-    for _ in range(NUM_STEPS):
-        wmr.step()
+def num_records() -> int:
+    # Adaptive stepping records once per control period instead of per step
+    adaptive = args.stepping == "adaptive"
+    return int(DURATION / (CONTROL_STEP if adaptive else TIME_STEP)) + 1
 
-        if wmr.time >= next_control_time:
-            dist = wmr.sensor_distance
 
-            speed = clamp(-speed_max, speed_max, dist * speed_slope + speed_intercept)
-            wmr.set_angular_velocity(speed)
+def simulate(
+    bodies: list[dict],
+    controller: Controller,
+    scenario: Scenario = SCENARIOS[0],
+    visualize=False,
+) -> list[dict]:
+    # Robots are stepped together so that the controller is run once per
+    # control tick for the whole batch
+    wmrs = [
+        WMR(
+            **body,
+            duration=DURATION,
+            time_step=TIME_STEP,
+            visualize=visualize,
+            contact_mode=ContactMode.POLL,
+            step_height=scenario.step_height,
+            wall_position_x=scenario.wall_position_x,
+            ground_friction=scenario.ground_friction,
+            terrain_seed=scenario.terrain_seed,
+        )
+        for body in bodies
+    ]
 
-            next_control_time += CONTROL_STEP
+    # Control ticks are counted in integer ticks of TIME_STEP (no drift)
+    CONTROL_TICKS = round(CONTROL_STEP / TIME_STEP)
+    next_control_tick = 0
 
-        sim_info["distance"].append(wmr.sensor_distance)
-        sim_info["speed"].append(wmr.angular_velocity)
-        sim_info["contact"].append(wmr.contacting_wall())
-        sim_info["location"].append(wmr.chassis.position.x)
+    adaptive = args.stepping == "adaptive"
+    NUM_STEPS = num_records()
 
-    if visualize:
-        sim_info["visualization"] = wmr.get_visualization_json()
+    sim_infos = [
+        {
+            "distance": [],
+            "speed": [],
+            "contact": [],
+            "impulse": [],
+            "location": [],
+            "visualization": None,
+        }
+        for _ in wmrs
+    ]
 
-    return sim_info
+    for _ in range(NUM_STEPS):
+        for wmr in wmrs:
+            if adaptive:
+                wmr.advance(CONTROL_STEP)
+            else:
+                wmr.step()
 
+        # All robots share the same ticks
+        if wmrs[0].ticks >= next_control_tick:
+            distance = np.array([wmr.sensor_distance for wmr in wmrs])
 
-def fitness(genome: Genome, testing=False) -> tuple[Fitness, dict]:
-    # TODO: save individual values
+            for wmr, speed in zip(wmrs, controller(distance).tolist()):
+                wmr.set_angular_velocity(speed)
 
-    # Scale genome to actual values
-    params = {
-        k: scale(0, 1, lo, hi, g)
-        for (k, (lo, hi)), g in zip(GENOME_MAPPING.items(), genome)
-    }
+            next_control_tick += CONTROL_TICKS
 
-    # Check feasibility
-    wheel_overlap = params["chassis_length"] / 2 - params["wheel_radius"]
+        for wmr, sim_info in zip(wmrs, sim_infos):
+            sim_info["distance"].append(wmr.sensor_distance)
+            sim_info["speed"].append(wmr.angular_velocity)
+            sim_info["contact"].append(wmr.contacting_wall())
+            sim_info["impulse"].append(wmr.wall_impulse())
+            sim_info["location"].append(wmr.chassis.position.x)
+
+    if visualize:
+        for wmr, sim_info in zip(wmrs, sim_infos):
+            sim_info["visualization"] = wmr.get_visualization_json()
 
-    if wheel_overlap < 0:
-        return Fitness(wheel_overlap, 0), {}
+    return sim_infos
 
-    # Simulate and evaluate
 
-    sim_info: dict = simulate(visualize=testing, **params)
+def score(genome: Genome, params: dict, scenario: Scenario, sim_info: dict) -> float:
     n = len(sim_info["speed"])
 
     sim_info["objective"] = {}
 
     objective = 0
 
+    # The target keeps its offset from the wall
+    wall_offset = scenario.wall_position_x - WALL_POSITION_X
+    target_location = TARGET_LOCATION + wall_offset
+    initial_target_distance = INITIAL_TARGET_DISTANCE + wall_offset
+
     # Minimize final distance from target
-    distance_to_target = sim_info["location"][-1] - TARGET_LOCATION
-    objective += 2 * (1 - abs(distance_to_target) / INITIAL_TARGET_DISTANCE)
+    distance_to_target = sim_info["location"][-1] - target_location
+    objective += 2 * (1 - abs(distance_to_target) / initial_target_distance)
     sim_info["objective"]["final_distance"] = distance_to_target
 
     # Penalize final velocity
@@ -170,6 +265,7 @@ def fitness(genome: Genome, testing=False) -> tuple[Fitness, dict]:
     hit_wall = any(sim_info["contact"])
     objective += 0.5 * (1 - hit_wall)
     sim_info["objective"]["hit_wall"] = hit_wall
+    sim_info["objective"]["wall_impulse"] = sum(sim_info["impulse"])
 
     # Minimize wheel radius (genome is already scaled 0 to 1)
     objective += 0.25 * (1 - genome[0])
@@ -184,24 +280,209 @@ def fitness(genome: Genome, testing=False) -> tuple[Fitness, dict]:
     objective += 0.25 * (1 - (index / n))
     sim_info["objective"]["index_at_rest"] = index
 
-    return Fitness(0, objective), sim_info
+    return objective
+
+
+def fitness_batch(
+    genomes: list[Genome], testing=False, threshold=-inf
+) -> list[tuple[Fitness, dict]]:
+    # TODO: save individual values
+
+    values = decode(genomes)
+    params = [dict(zip(GENOME_MAPPING.keys(), row)) for row in values.tolist()]
+
+    results: list = [None] * len(genomes)
+
+    # Check feasibility
+    alive = []
+    for i, genome_params in enumerate(params):
+        wheel_overlap = (
+            genome_params["chassis_length"] / 2 - genome_params["wheel_radius"]
+        )
+        if wheel_overlap < 0:
+            results[i] = (Fitness(wheel_overlap, 0), {})
+        else:
+            alive.append(i)
+
+    # Simulate and evaluate each scenario (only the first is visualized)
+
+    selected = scenarios()
+    num_scenarios = len(selected)
+
+    total_objective = {i: 0 for i in alive}
+    sim_infos = {}
+
+    for s, scenario in enumerate(selected):
+        if not alive:
+            break
+
+        bodies = [{k: params[i][k] for k in BODY_MAPPING} for i in alive]
+        controller = CONTROLLER(values[alive, len(BODY_MAPPING) :])
+        scenario_infos = simulate(
+            bodies, controller, scenario, visualize=testing and s == 0
+        )
+
+        num_remaining = num_scenarios - s - 1
+        still_alive = []
+
+        for i, scenario_info in zip(alive, scenario_infos):
+            total_objective[i] += score(genomes[i], params[i], scenario, scenario_info)
+
+            if s == 0:
+                sim_infos[i] = scenario_info
+                sim_infos[i]["scenarios"] = []
+            sim_infos[i]["scenarios"].append(scenario_info["objective"])
+
+            # Racing: stop once even a perfect score on the remaining scenarios
+            # cannot beat the threshold (the bound is used as the objective)
+            bound = (total_objective[i] + num_remaining * MAX_OBJECTIVE) / num_scenarios
+            if num_remaining and bound < threshold:
+                sim_infos[i]["runs_saved"] = num_remaining
+                results[i] = (Fitness(0, bound), sim_infos[i])
+            else:
+                still_alive.append(i)
+
+        alive = still_alive
+
+    for i in alive:
+        sim_infos[i]["runs_saved"] = 0
+        results[i] = (Fitness(0, total_objective[i] / num_scenarios), sim_infos[i])
+
+    return results
+
+
+def fitness(genome: Genome, testing=False, threshold=-inf) -> tuple[Fitness, dict]:
+    return fitness_batch([genome], testing, threshold)[0]
 
 
 def initialize(size: int) -> Population:
     return [(generate_genome(), DEFAULT_FITNESS) for _ in range(size)]
 
 
-def evaluate(pop: Population, manager) -> Population:
+def racing_threshold(pop: Population) -> float:
+    # Objective that a child must be able to beat to keep being evaluated
+    objectives = sorted(fitness.objective for _, fitness in pop)
+    index = round(args.racing_quantile * (len(objectives) - 1))
+    return objectives[index]
+
+
+def prefilter(genomes: list[Genome]) -> dict[int, tuple[Fitness, dict]]:
+    # Run the kinematic model for all genomes at once and return the fitness
+    # of those that crash into the wall or never get near the target; only
+    # these skip the Box2D simulation
+    values = decode(genomes)
+    params = dict(zip(GENOME_MAPPING.keys(), values.T))
+
+    # Obstacles are ignored, only the wall matters
+    scenario = scenarios()[0]
+    wall_offset = scenario.wall_position_x - WALL_POSITION_X
+
+    sim_info = wmr_kinematic.simulate(
+        wheel_radius=params["wheel_radius"],
+        chassis_length=params["chassis_length"],
+        sensor_limit=params["sensor_limit"],
+        controller=CONTROLLER(values[:, len(BODY_MAPPING) :]),
+        duration=DURATION,
+        time_step=TIME_STEP,
+        control_step=CONTROL_STEP,
+        wall_position_x=scenario.wall_position_x,
+    )
+
+    feasible = params["chassis_length"] / 2 - params["wheel_radius"] >= 0
+    crashed = sim_info["contact"].any(axis=0)
+    target_location = TARGET_LOCATION + wall_offset
+    short = sim_info["location"].max(axis=0) < target_location - PREFILTER_MARGIN
+    rejected = np.flatnonzero(feasible & (crashed | short))
+
+    rejected_results = {}
+    for i in rejected:
+        robot_params = {k: v[i] for k, v in params.items()}
+        robot_info = {k: v[:, i].tolist() for k, v in sim_info.items()}
+        robot_info["impulse"] = [0.0] * len(robot_info["speed"])
+
+        # The kinematic score can beat the Box2D one, so it is only kept for
+        # reference. Rejected genomes earn the wheel radius term alone (every
+        # simulated term counts as zero), which is the same for any scenario
+        # set and ranks them below nearly every simulated genome.
+        robot_info["kinematic_objective"] = score(
+            genomes[i], robot_params, scenario, robot_info
+        )
+        objective = 0.25 * (1 - genomes[i][0])
+        rejected_results[int(i)] = (Fitness(0, objective), robot_info)
+
+    return rejected_results
+
+
+def behavior(sim_info: dict) -> np.ndarray:
+    # Behavior descriptor (roughly in [0, 1]) on the nominal scenario
+    objective = sim_info["objective"]
+    return np.array(
+        [
+            objective["final_distance"] / INITIAL_TARGET_DISTANCE,
+            objective["final_speed"] / GENOME_MAPPING["speed_max"][1],
+            float(objective["hit_wall"]),
+            objective["index_at_rest"] / len(sim_info["speed"]),
+        ]
+    )
+
+
+def evaluate(
+    pop: Population, manager, threshold=-inf, archive: NoveltyArchive | None = None
+) -> tuple[Population, list[float], dict]:
+    # Also returns the task objective of each individual (which differs from
+    # the evaluated objective in novelty search)
     progress = manager.counter(total=len(pop), desc="Evaluations", leave=False)
 
-    evaluated_population = []
-    for genome, _ in pop:
-        evaluated_population.append((genome, fitness(genome)[0]))
-        progress.update()
+    rejected = prefilter([genome for genome, _ in pop]) if args.prefilter else {}
+
+    evaluated_fitness = {
+        i: genome_fitness for i, (genome_fitness, _) in rejected.items()
+    }
+    behaviors = {i: behavior(info) for i, (_, info) in rejected.items()}
+
+    stats = {
+        "Racing Saved": 0,
+        "Prefiltered": len(rejected),
+        "Archive Size": 0,
+    }
+
+    # Remaining individuals are simulated in batches
+    remaining = [i for i in range(len(pop)) if i not in rejected]
+    progress.update(len(rejected))
+
+    for start in range(0, len(remaining), args.batch_size):
+        batch = remaining[start : start + args.batch_size]
+        results = fitness_batch([pop[i][0] for i in batch], threshold=threshold)
+
+        for i, (genome_fitness, sim_info) in zip(batch, results):
+            evaluated_fitness[i] = genome_fitness
+            stats["Racing Saved"] += sim_info.get("runs_saved", 0)
+            if "objective" in sim_info:
+                behaviors[i] = behavior(sim_info)
+
+        progress.update(len(batch))
+
+    task_objectives = [evaluated_fitness[i].objective for i in range(len(pop))]
+
+    # Novelty search: new behaviors are archived, and the objective becomes
+    # the mean distance to the nearest other archived behaviors
+    if archive is not None:
+        for b in behaviors.values():
+            archive.add(b)
+
+        for i, b in behaviors.items():
+            novelty = archive.novelty(b, args.novelty_k)
+            evaluated_fitness[i] = Fitness(evaluated_fitness[i].feasibility, novelty)
+
+        stats["Archive Size"] = len(archive)
+
+    evaluated_population = [
+        (genome, evaluated_fitness[i]) for i, (genome, _) in enumerate(pop)
+    ]
 
     progress.close(clear=True)
 
-    return evaluated_population
+    return evaluated_population, task_objectives, stats
 
     # return [(genome, fitness(genome)[0]) for genome, _ in pop]
 
@@ -256,6 +537,21 @@ def combine(original: Population, children: Population) -> Population:
     return [best] + children[:-1]
 
 
+class GeneticAlgorithm(Optimizer):
+    def __init__(self, initial: list[Genome]):
+        self.initial = initial
+        self.parents: Population = []
+
+    def ask(self) -> list[Genome]:
+        if not self.parents:
+            return self.initial
+        return [genome for genome, _ in modify(select(self.parents))]
+
+    def tell(self, genomes: list[Genome], fitnesses: list[Fitness]):
+        evaluated = list(zip(genomes, fitnesses))
+        self.parents = combine(self.parents, evaluated) if self.parents else evaluated
+
+
 def statistics(pop: Population) -> tuple[Fitness, Fitness, Fitness]:
     worst = min(pop, key=fitness_key)[1]
     best = max(pop, key=fitness_key)[1]
@@ -265,6 +561,84 @@ def statistics(pop: Population) -> tuple[Fitness, Fitness, Fitness]:
     return worst, average, best
 
 
+def parallel_map(function, *iterables) -> list:
+    if args.workers > 1:
+        with ProcessPoolExecutor(max_workers=args.workers) as executor:
+            return list(executor.map(function, *iterables))
+    return list(map(function, *iterables))
+
+
+def objective_info(
+    genome: Genome, index: int | None = None, handle: Handle | None = None
+) -> tuple[Fitness, dict]:
+    # Only the summary of a simulation is returned; trajectories (if wanted)
+    # are written straight into a block of the trajectory ring. Infeasible
+    # genomes are never simulated and have no summary.
+    genome_fitness, sim_info = fitness(genome)
+    if handle is not None:
+        attached(handle).write(index, sim_info)
+    if "objective" not in sim_info:
+        return genome_fitness, {}
+    return genome_fitness, {"objective": sim_info["objective"]}
+
+
+def export_visualization(genome: Genome, path: str) -> tuple[Fitness, dict]:
+    # Replay a single simulation and write its visualization to its own file
+    # (the logger still holds all of this replay's frames until then)
+    genome_fitness, sim_info = fitness(genome, testing=True)
+    with open(path, "w") as f:
+        json.dump(sim_info.get("visualization"), f)
+    return genome_fitness, sim_info.get("objective", {})
+
+
+def pareto_front(points: list[tuple[float, ...]]) -> list[int]:
+    # Indices of the points not dominated by any other point (minimizing)
+    def dominates(p, q):
+        return all(a <= b for a, b in zip(p, q)) and p != q
+
+    return [i for i, p in enumerate(points) if not any(dominates(q, p) for q in points)]
+
+
+def export_selection(
+    population: Population, pop_sim: list[tuple[Fitness, dict]], elites: Population
+) -> dict[str, Genome]:
+    # Map from file suffix to the genome to visualize
+    if args.export == "top_k":
+        ranked = sorted(
+            range(len(population)), key=lambda i: pop_sim[i][0], reverse=True
+        )
+        return {
+            f"-top{rank}": population[i][0]
+            for rank, i in enumerate(ranked[: args.export_k])
+        }
+
+    if args.export == "pareto":
+        feasible = [i for i, (f, _) in enumerate(pop_sim) if f.feasibility == 0]
+        points = []
+        for i in feasible:
+            objective = pop_sim[i][1]["objective"]
+            points.append(
+                (
+                    abs(objective["final_distance"]),
+                    abs(objective["final_speed"]),
+                    objective["hit_wall"],
+                    objective["index_at_rest"],
+                    objective["wheel_radius"],
+                )
+            )
+        front = [feasible[i] for i in pareto_front(points)]
+        return {f"-pareto{i}": population[i][0] for i in front}
+
+    if args.export == "elites":
+        return {
+            f"-gen{generation}": ind
+            for generation, (ind, _) in enumerate(elites)
+            if generation % args.export_k == 0 or generation == len(elites) - 1
+        }
+
+    return {}
+
+
 def main():
     df_generations = pd.DataFrame(
         columns=[
@@ -274,6 +648,11 @@ def main():
             "Worst Objective",
             "Average Objective",
             "Best Objective",
+            "Racing Saved",
+            "Prefiltered",
+            "Best Task Objective",
+            "Archive Size",
+            "Evaluations",
         ]
     )
 
@@ -303,41 +682,67 @@ def main():
     #     json.dump(seed_info["visualization"], f)
     # raise SystemExit
 
-    population = initialize(args.population_size)
-    population[0] = (seed_genome, DEFAULT_FITNESS)
+    # The seed values only apply to the linear controller
+    seeded = seed_values.keys() == GENOME_MAPPING.keys()
+
+    if args.optimizer == "cmaes":
+        mean = seed_genome if seeded else [0.5] * len(GENOME_MAPPING)
+        optimizer = CMAES(mean, CMAES_SIGMA, args.population_size, args.seed)
+    else:
+        initial = [genome for genome, _ in initialize(args.population_size)]
+        if seeded:
+            initial[0] = seed_genome
+        optimizer = GeneticAlgorithm(initial)
 
-    population = evaluate(population, manager)
+    archive = None
+    if args.novelty:
+        archive = NoveltyArchive(4, args.archive_size, NOVELTY_CELL_SIZE)
 
-    worst, average, best = statistics(population)
+    # Best of all evaluated individuals along with the newest batch
+    population: Population = []
+    num_evaluations = 0
 
-    progress.update()
+    # Best individual of each generation (for exporting)
+    elites: Population = []
 
-    df_generations.loc[0] = [
-        worst.feasibility,
-        average.feasibility,
-        best.feasibility,
-        worst.objective,
-        average.objective,
-        best.objective,
-    ]
+    # Task objective of each genome in the population
+    task_objective: dict[tuple[float, ...], float] = {}
 
-    for generation in range(args.num_generations):
-        if stop(population):
+    for generation in range(args.num_generations + 1):
+        if population and stop(population):
             break
 
-        selected = select(population)
-        children = modify(selected)
-        children = evaluate(children, manager)
-        population = combine(population, children)
+        # Racing compares task objectives, so it is off for novelty search
+        threshold = racing_threshold(population) if population else -inf
+        threshold = -inf if args.novelty else threshold
+
+        batch = [(genome, DEFAULT_FITNESS) for genome in optimizer.ask()]
+        evaluated, task_objectives, stats = evaluate(batch, manager, threshold, archive)
+        optimizer.tell(*map(list, zip(*evaluated)))
+
+        population = combine(population, evaluated) if population else evaluated
+        num_evaluations += len(evaluated)
+        elites.append(max(population, key=fitness_key))
+
+        for (genome, _), objective in zip(evaluated, task_objectives):
+            task_objective[tuple(genome)] = objective
+        task_objective = {
+            tuple(genome): task_objective[tuple(genome)] for genome, _ in population
+        }
 
         worst, average, best = statistics(population)
-        df_generations.loc[generation + 1] = [
+        df_generations.loc[generation] = [
             worst.feasibility,
             average.feasibility,
             best.feasibility,
             worst.objective,
             average.objective,
             best.objective,
+            stats["Racing Saved"],
+            stats["Prefiltered"],
+            max(task_objective.values()),
+            stats["Archive Size"],
+            num_evaluations,
         ]
 
         progress.update()
@@ -360,12 +765,27 @@ def main():
     def val_or_nan(i, key):
         return i["objective"][key] if "objective" in i else float("nan")
 
-    pop_sim = [fitness(ind, testing=True) for ind, _ in population]
+    # Trajectories of the final population go to a memory-mapped .npy file
+    # with shape (individual, field, step), see wmr_transport.FIELDS
+    ring = None
+    if args.trajectories:
+        ring = TrajectoryRing.create(
+            len(population), num_records(), f"{args.name}-trajectories.npy"
+        )
+
+    genomes = [ind for ind, _ in population]
+    indices = [ring.acquire() if ring else None for _ in population]
+    handles = [ring.handle if ring else None for _ in population]
+    pop_sim = parallel_map(objective_info, genomes, indices, handles)
+
+    if ring:
+        ring.close()
     pop_info["feasibility"] = [f.feasibility for f, _ in pop_sim]
     pop_info["objective"] = [f.objective for f, _ in pop_sim]
     pop_info["final_distance"] = [val_or_nan(i, "final_distance") for _, i in pop_sim]
     pop_info["final_speed"] = [val_or_nan(i, "final_speed") for _, i in pop_sim]
     pop_info["hit_wall"] = [val_or_nan(i, "hit_wall") for _, i in pop_sim]
+    pop_info["wall_impulse"] = [val_or_nan(i, "wall_impulse") for _, i in pop_sim]
     pop_info["wheel_radius"] = [val_or_nan(i, "wheel_radius") for _, i in pop_sim]
     pop_info["index_at_rest"] = [val_or_nan(i, "index_at_rest") for _, i in pop_sim]
 
@@ -373,15 +793,34 @@ def main():
         f"{args.name}-population.csv", index_label="Individual"
     )
 
-    best_individual = max(population, key=fitness_key)
-    best_fitness, best_info = fitness(best_individual[0], testing=True)
+    # Visualizations are replayed and written one at a time so that memory
+    # does not grow with the population size or the number of exports (it
+    # still grows with DURATION, as each replay is held in full)
+
+    # Ranked by the re-evaluated task fitness (not the racing bound or novelty)
+    best_index = max(range(len(population)), key=lambda i: pop_sim[i][0])
+    best_individual = population[best_index]
+
+    exports = {"": best_individual[0]}
+    exports.update(export_selection(population, pop_sim, elites))
+
+    genomes = list(exports.values())
+    paths = [f"{args.name}-visualization{suffix}.json" for suffix in exports]
+
+    results = parallel_map(export_visualization, genomes, paths)
+
+    best_fitness, best_objective = results[0]
 
     print(args.name)
     print(best_fitness)
-    print(best_info["objective"])
-
-    with open(f"{args.name}-visualization.json", "w") as f:
-        json.dump(best_info["visualization"], f)
+    print(best_objective)
+
+    if args.target is not None:
+        # "Best Objective" is the novelty score in novelty search
+        best_task = df_generations["Best Task Objective"]
+        reached = df_generations[best_task >= args.target]
+        evaluations = reached["Evaluations"].iloc[0] if len(reached) else None
+        print(f"Evaluations to reach {args.target}: {evaluations}")
 
     progress.close()
     manager.stop()
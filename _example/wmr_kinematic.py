@@ -0,0 +1,80 @@
+from collections.abc import Callable
+
+import numpy as np
+from wmr import (
+    SENSOR_Y_OFFSET,
+    WALL_HEIGHT,
+    WALL_POSITION_X,
+    WHEEL_INWARD_OFFSET,
+    WMR_X_OFFSET,
+    WMR_Y_OFFSET,
+)
+
+# Reduced-order (kinematic) counterpart of WMR (same as the numerical mode of
+# the WMR2D library): the chassis stays level, the step is ignored, and the
+# wheels roll without slipping at the commanded angular velocity. Every
+# argument is an array with one entry per robot so that a whole population is
+# stepped at once.
+
+
+def front_wheel_edge(location, wheel_radius, chassis_length):
+    return location + chassis_length / 2 - WHEEL_INWARD_OFFSET + wheel_radius
+
+
+def distance_sensor(location, wheel_radius, sensor_limit, wall_position_x):
+    # The sensor ray is horizontal, so it can only hit the wall
+    sensor_height = wheel_radius + WMR_Y_OFFSET + SENSOR_Y_OFFSET
+    wall_distance = wall_position_x - location
+    hits_wall = (wall_distance >= 0) & (sensor_height <= WALL_HEIGHT)
+    return np.where(hits_wall, np.minimum(wall_distance, sensor_limit), sensor_limit)
+
+
+def simulate(
+    *,
+    wheel_radius: np.ndarray,
+    chassis_length: np.ndarray,
+    sensor_limit: np.ndarray,
+    controller: Callable[[np.ndarray], np.ndarray],
+    duration: float,
+    time_step: float,
+    control_step: float,
+    wall_position_x: float = WALL_POSITION_X,
+) -> dict[str, np.ndarray]:
+    num_robots = len(wheel_radius)
+    num_steps = int(duration / time_step) + 1
+    control_ticks = max(1, round(control_step / time_step))
+
+    location = np.full(num_robots, WMR_X_OFFSET, dtype=float)
+    angular_velocity = np.zeros(num_robots)
+
+    # Recorded values have shape (num_steps, num_robots)
+    sim_info = {
+        "distance": np.empty((num_steps, num_robots)),
+        "speed": np.empty((num_steps, num_robots)),
+        "contact": np.empty((num_steps, num_robots), dtype=bool),
+        "location": np.empty((num_steps, num_robots)),
+    }
+
+    for step in range(num_steps):
+        # Explicit Euler integration (v = ω r)
+        location = location + angular_velocity * wheel_radius * time_step
+
+        # Robots cannot move through the wall
+        edge = front_wheel_edge(location, wheel_radius, chassis_length)
+        contact = edge >= wall_position_x
+        location = np.where(contact, location - (edge - wall_position_x), location)
+
+        distance = distance_sensor(
+            location, wheel_radius, sensor_limit, wall_position_x
+        )
+
+        # Batched controller (see wmr_controllers.py)
+        if step % control_ticks == 0:
+            angular_velocity = controller(distance)
+
+        sim_info["distance"][step] = distance
+        sim_info["speed"][step] = angular_velocity
+        sim_info["contact"][step] = contact
+        sim_info["location"][step] = location
+
+    return sim_info
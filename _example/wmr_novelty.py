@@ -0,0 +1,99 @@
+from collections import defaultdict
+from functools import cache
+from itertools import product
+
+import numpy as np
+
+# Archive of behavior descriptors for novelty search. Points are indexed by a
+# uniform grid (a dict from cell to slots) so that k-nearest-neighbor queries
+# only visit the cells around the query. The archive has a fixed capacity,
+# and once full the oldest entry is evicted for each new one.
+
+
+@cache
+def shell(radius: int, dimensions: int) -> list[tuple[int, ...]]:
+    # Cell offsets at exactly this Chebyshev distance
+    return [
+        offset
+        for offset in product(range(-radius, radius + 1), repeat=dimensions)
+        if max(map(abs, offset), default=0) == radius
+    ]
+
+
+class NoveltyArchive:
+    def __init__(self, dimensions: int, capacity: int, cell_size: float):
+        self.dimensions = dimensions
+        self.capacity = capacity
+        self.cell_size = cell_size
+
+        self.points = np.empty((capacity, dimensions))
+        self.cells: list[tuple[int, ...]] = [()] * capacity
+        self.grid: dict[tuple[int, ...], set[int]] = defaultdict(set)
+
+        self.size = 0
+        self.next_slot = 0
+
+    def __len__(self) -> int:
+        return self.size
+
+    def cell(self, point: np.ndarray) -> tuple[int, ...]:
+        return tuple(np.floor(point / self.cell_size).astype(int).tolist())
+
+    def add(self, point: np.ndarray):
+        slot = self.next_slot
+
+        # Evict the oldest entry when full
+        if self.size == self.capacity:
+            cell = self.cells[slot]
+            self.grid[cell].discard(slot)
+            if not self.grid[cell]:
+                del self.grid[cell]
+        else:
+            self.size += 1
+
+        cell = self.cell(point)
+        self.points[slot] = point
+        self.cells[slot] = cell
+        self.grid[cell].add(slot)
+
+        self.next_slot = (slot + 1) % self.capacity
+
+    def nearest_distances(self, point: np.ndarray, k: int) -> np.ndarray:
+        k = min(k, self.size)
+        if k == 0:
+            return np.empty(0)
+
+        center = self.cell(point)
+        candidates: list[int] = []
+        radius = 0
+
+        while True:
+            offsets = shell(radius, self.dimensions)
+
+            # Visiting more cells than there are points is slower than a scan
+            if len(offsets) > self.size:
+                candidates = list(range(self.size))
+                break
+
+            for offset in offsets:
+                cell = tuple(c + o for c, o in zip(center, offset))
+                candidates.extend(self.grid.get(cell, ()))
+
+            # Points in unvisited cells are further than radius * cell_size
+            if len(candidates) >= k:
+                distances = self.distances(point, candidates)
+                if np.partition(distances, k - 1)[k - 1] <= radius * self.cell_size:
+                    return np.sort(distances)[:k]
+
+            radius += 1
+
+        return np.sort(self.distances(point, candidates))[:k]
+
+    def distances(self, point: np.ndarray, slots: list[int]) -> np.ndarray:
+        return np.linalg.norm(self.points[slots] - point, axis=1)
+
+    def novelty(self, point: np.ndarray, k: int) -> float:
+        # Mean distance to the k nearest other archived behaviors (the point
+        # itself must already be archived, it is its own nearest neighbor)
+        distances = self.nearest_distances(point, k + 1)[1:]
+        return float(distances.mean()) if len(distances) else 0.0
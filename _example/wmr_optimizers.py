@@ -0,0 +1,108 @@
+from abc import ABC, abstractmethod
+from math import exp, log, sqrt
+
+import numpy as np
+
+# Ask/tell optimizers: ask() proposes a whole batch of genomes (genes in
+# [0, 1]) for the evaluator and tell() receives their fitnesses (larger is
+# better, any comparable values) in the same order.
+
+
+class Optimizer(ABC):
+    @abstractmethod
+    def ask(self) -> list[list[float]]: ...
+
+    @abstractmethod
+    def tell(self, genomes: list[list[float]], fitnesses: list): ...
+
+
+class CMAES(Optimizer):
+    # (mu/mu_w, lambda)-CMA-ES, see Hansen, "The CMA Evolution Strategy: A
+    # Tutorial" (2016); samples are clipped to the genome bounds
+
+    def __init__(
+        self,
+        mean: list[float],
+        sigma: float,
+        population_size: int,
+        seed: int | None = None,
+    ):
+        self.rng = np.random.default_rng(seed)
+
+        n = len(mean)
+        self.n = n
+        self.mean = np.array(mean, dtype=float)
+        self.sigma = sigma
+
+        self.lam = population_size
+        self.mu = population_size // 2
+
+        weights = log(self.mu + 0.5) - np.log(np.arange(1, self.mu + 1))
+        self.weights = weights / weights.sum()
+        self.mueff = 1 / np.sum(self.weights**2)
+
+        # Adaptation rates
+        self.cc = (4 + self.mueff / n) / (n + 4 + 2 * self.mueff / n)
+        self.cs = (self.mueff + 2) / (n + self.mueff + 5)
+        self.c1 = 2 / ((n + 1.3) ** 2 + self.mueff)
+        self.cmu = min(
+            1 - self.c1,
+            2 * (self.mueff - 2 + 1 / self.mueff) / ((n + 2) ** 2 + self.mueff),
+        )
+        self.damps = 1 + 2 * max(0, sqrt((self.mueff - 1) / (n + 1)) - 1) + self.cs
+        self.chi_n = sqrt(n) * (1 - 1 / (4 * n) + 1 / (21 * n**2))
+
+        # Evolution paths and covariance matrix (C = B diag(D^2) B^T)
+        self.pc = np.zeros(n)
+        self.ps = np.zeros(n)
+        self.B = np.eye(n)
+        self.D = np.ones(n)
+        self.C = np.eye(n)
+
+        self.generation = 0
+
+    def ask(self) -> list[list[float]]:
+        z = self.rng.standard_normal((self.lam, self.n))
+        samples = self.mean + self.sigma * (z * self.D) @ self.B.T
+        return np.clip(samples, 0, 1).tolist()
+
+    def tell(self, genomes: list[list[float]], fitnesses: list):
+        self.generation += 1
+
+        order = sorted(range(len(genomes)), key=lambda i: fitnesses[i], reverse=True)
+        x = np.array(genomes)[order[: self.mu]]
+
+        old_mean = self.mean
+        self.mean = self.weights @ x
+        y = (x - old_mean) / self.sigma
+        y_w = (self.mean - old_mean) / self.sigma
+
+        # Step-size path (uses C^(-1/2) = B diag(1/D) B^T)
+        inv_sqrt_c = self.B @ np.diag(1 / self.D) @ self.B.T
+        self.ps = (1 - self.cs) * self.ps + sqrt(
+            self.cs * (2 - self.cs) * self.mueff
+        ) * (inv_sqrt_c @ y_w)
+
+        ps_norm = np.linalg.norm(self.ps)
+        ps_scale = sqrt(1 - (1 - self.cs) ** (2 * self.generation))
+        hsig = ps_norm / ps_scale / self.chi_n < 1.4 + 2 / (self.n + 1)
+
+        # Covariance path, rank-one and rank-mu updates
+        self.pc = (1 - self.cc) * self.pc + hsig * sqrt(
+            self.cc * (2 - self.cc) * self.mueff
+        ) * y_w
+
+        rank_one = np.outer(self.pc, self.pc)
+        rank_one += (1 - hsig) * self.cc * (2 - self.cc) * self.C
+        rank_mu = (y.T * self.weights) @ y
+
+        self.C = (
+            (1 - self.c1 - self.cmu) * self.C + self.c1 * rank_one + self.cmu * rank_mu
+        )
+
+        self.sigma *= exp((self.cs / self.damps) * (ps_norm / self.chi_n - 1))
+
+        # Keep C symmetric and positive definite
+        self.C = np.triu(self.C) + np.triu(self.C, 1).T
+        eigenvalues, self.B = np.linalg.eigh(self.C)
+        self.D = np.sqrt(np.maximum(eigenvalues, 1e-20))
@@ -0,0 +1,79 @@
+from sys import argv
+from time import perf_counter
+
+from wmr import WMR, ContactMode
+
+# Compare fixed stepping (WMR.step) with adaptive stepping (WMR.advance) on a
+# few controllers: wall-clock time, number of physics substeps, and how far
+# the adaptive run ends up from the fixed one
+
+duration = 20
+time_step = 0.01
+control_step = 0.1
+
+body = {
+    "wheel_radius": 1.2,
+    "chassis_length": 3,
+    "suspension_frequency": 4,
+    "suspension_damping": 0.7,
+    "sensor_limit": 10,
+}
+
+# speed_max, speed_slope, speed_intercept
+controllers = {
+    "demo": (3, 2, -15),
+    "fast": (8, 2, -11),
+    "crash": (5, 0, 5),
+    "slow": (1, 1, -2),
+}
+
+
+def run(adaptive: bool, speed_max: float, speed_slope: float, speed_intercept: float):
+    wmr = WMR(
+        **body,
+        duration=duration,
+        time_step=time_step,
+        contact_mode=ContactMode.POLL,
+    )
+
+    control_ticks = round(control_step / time_step)
+    hit_wall = False
+
+    start = perf_counter()
+
+    while wmr.ticks < round(duration / time_step):
+        speed = wmr.sensor_distance * speed_slope + speed_intercept
+        wmr.set_angular_velocity(max(-speed_max, min(speed_max, speed)))
+
+        if adaptive:
+            wmr.advance(control_step)
+        else:
+            for _ in range(control_ticks):
+                wmr.step()
+
+        hit_wall = hit_wall or wmr.contacting_wall()
+
+    elapsed = perf_counter() - start
+
+    return elapsed, wmr.num_substeps, wmr.chassis.position.x, hit_wall
+
+
+print(
+    f"{'controller':>10} {'fixed (s)':>10} {'adaptive (s)':>12} {'speedup':>8}"
+    f" {'substeps':>14} {'final x':>16} {'|dx|':>8} {'hit wall':>12}"
+)
+
+repeats = int(argv[1]) if len(argv) > 1 else 3
+
+for name, controller in controllers.items():
+    fixed = min(run(False, *controller) for _ in range(repeats))
+    adaptive = min(run(True, *controller) for _ in range(repeats))
+
+    print(
+        f"{name:>10} {fixed[0]:>10.3f} {adaptive[0]:>12.3f}"
+        f" {fixed[0] / adaptive[0]:>8.2f}"
+        f" {fixed[1]:>6} / {adaptive[1]:<5}"
+        f" {fixed[2]:>7.3f} / {adaptive[2]:<6.3f}"
+        f" {abs(fixed[2] - adaptive[2]):>8.3f}"
+        f" {str(fixed[3]):>5} / {str(adaptive[3]):<5}"
+    )
@@ -0,0 +1,253 @@
+import sqlite3
+from argparse import ArgumentParser
+from pathlib import Path
+
+import pandas as pd
+
+# Trial outputs are stored in long format (one row per value) so that new
+# columns in the CSV files never require a schema change
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    id INTEGER PRIMARY KEY,
+    path TEXT UNIQUE NOT NULL,
+    experiment TEXT NOT NULL,
+    trial TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS generations (
+    file_id INTEGER NOT NULL REFERENCES files(id),
+    experiment TEXT NOT NULL,
+    trial TEXT NOT NULL,
+    generation INTEGER NOT NULL,
+    metric TEXT NOT NULL,
+    value REAL
+);
+
+CREATE TABLE IF NOT EXISTS population (
+    file_id INTEGER NOT NULL REFERENCES files(id),
+    experiment TEXT NOT NULL,
+    trial TEXT NOT NULL,
+    individual INTEGER NOT NULL,
+    metric TEXT NOT NULL,
+    value REAL
+);
+
+CREATE INDEX IF NOT EXISTS generations_metric
+    ON generations(experiment, metric, generation);
+CREATE INDEX IF NOT EXISTS generations_file ON generations(file_id);
+CREATE INDEX IF NOT EXISTS population_metric
+    ON population(experiment, metric, individual);
+CREATE INDEX IF NOT EXISTS population_file ON population(file_id);
+"""
+
+# Output kind -> (table, index column in the CSV, index column in the table)
+KINDS = {
+    "generations": ("generations", "Generation", "generation"),
+    "population": ("population", "Individual", "individual"),
+}
+
+
+def connect(db_path: str | Path) -> sqlite3.Connection:
+    con = sqlite3.connect(db_path)
+    con.executescript(SCHEMA)
+    return con
+
+
+def split_output_name(path: Path) -> tuple[str, str] | None:
+    # Outputs are named "{name}-generations.csv" and "{name}-population.csv"
+    name, _, kind = path.stem.rpartition("-")
+    return (name, kind) if name and kind in KINDS else None
+
+
+def remove_file(con: sqlite3.Connection, path: str) -> None:
+    row = con.execute("SELECT id, kind FROM files WHERE path = ?", (path,)).fetchone()
+    if row:
+        file_id, kind = row
+        table = KINDS[kind][0]
+        con.execute(f"DELETE FROM {table} WHERE file_id = ?", (file_id,))
+        con.execute("DELETE FROM files WHERE id = ?", (file_id,))
+
+
+def ingest_file(
+    con: sqlite3.Connection, path: Path, experiment: str, trial: str, kind: str
+) -> None:
+    # Files are keyed by their resolved path, however they were named
+    path = path.resolve()
+    table, csv_index, table_index = KINDS[kind]
+    stat = path.stat()
+
+    # Drop any rows from a previous version of this file
+    remove_file(con, str(path))
+
+    file_id = con.execute(
+        "INSERT INTO files (path, experiment, trial, kind, size, mtime_ns)"
+        " VALUES (?, ?, ?, ?, ?, ?)",
+        (str(path), experiment, trial, kind, stat.st_size, stat.st_mtime_ns),
+    ).lastrowid
+
+    df = pd.read_csv(path)
+    df = df.melt(id_vars=csv_index, var_name="metric", value_name="value")
+
+    # Booleans (e.g., hit_wall) are stored as 0/1
+    values = pd.to_numeric(df["value"].replace({"True": 1, "False": 0}))
+
+    con.executemany(
+        f"INSERT INTO {table} (file_id, experiment, trial, {table_index}, metric, value)"
+        " VALUES (?, ?, ?, ?, ?, ?)",
+        zip(
+            [file_id] * len(df),
+            [experiment] * len(df),
+            [trial] * len(df),
+            df[csv_index].astype(int).tolist(),
+            df["metric"].tolist(),
+            values.astype(float).tolist(),
+        ),
+    )
+
+
+def ingest(
+    con: sqlite3.Connection, data_dir: str | Path, experiment: str
+) -> tuple[int, int]:
+    # Only new, modified or relabeled files are (re-)ingested, and the rows of
+    # files that were deleted from data_dir are removed
+    data_dir = Path(data_dir).resolve()
+    known = {
+        path: (size, mtime_ns, file_experiment)
+        for path, size, mtime_ns, file_experiment in con.execute(
+            "SELECT path, size, mtime_ns, experiment FROM files"
+        )
+    }
+
+    num_ingested = 0
+
+    for path in sorted(data_dir.glob("*.csv")):
+        parts = split_output_name(path)
+        if not parts:
+            continue
+
+        path = path.resolve()
+        stat = path.stat()
+        if known.get(str(path)) == (stat.st_size, stat.st_mtime_ns, experiment):
+            continue
+
+        trial, kind = parts
+        with con:
+            ingest_file(con, path, experiment, trial, kind)
+        num_ingested += 1
+
+    removed = [
+        path
+        for path in known
+        if Path(path).parent == data_dir and not Path(path).exists()
+    ]
+    with con:
+        for path in removed:
+            remove_file(con, path)
+
+    return num_ingested, len(removed)
+
+
+# "Best Objective" holds the novelty score in novelty runs, so objectives are
+# read from "Best Task Objective" (equal to it otherwise), or from "Best
+# Objective" for older outputs without that column
+TASK_OBJECTIVE = """
+    WITH task AS (
+        SELECT * FROM generations WHERE metric = 'Best Task Objective'
+        UNION ALL
+        SELECT * FROM generations AS g
+        WHERE metric = 'Best Objective' AND NOT EXISTS (
+            SELECT 1 FROM generations
+            WHERE file_id = g.file_id AND metric = 'Best Task Objective'
+        )
+    )
+"""
+
+
+def best_objective_per_generation(
+    con: sqlite3.Connection, experiment: str | None = None
+) -> pd.DataFrame:
+    query = f"""{TASK_OBJECTIVE}
+        SELECT experiment AS Experiment, generation AS Generation,
+               MAX(value) AS "Best Objective", AVG(value) AS "Mean Best Objective",
+               COUNT(*) AS Trials
+        FROM task
+        WHERE ? IS NULL OR experiment = ?
+        GROUP BY experiment, generation
+        ORDER BY experiment, generation
+    """
+    return pd.read_sql_query(query, con, params=(experiment, experiment))
+
+
+def evaluations_to_target(
+    con: sqlite3.Connection, target: float, experiment: str | None = None
+) -> pd.DataFrame:
+    # Trials that never reach the target are not listed
+    query = f"""{TASK_OBJECTIVE}
+        SELECT best.experiment AS Experiment, best.trial AS Trial,
+               MIN(evaluations.value) AS Evaluations
+        FROM task AS best
+        JOIN generations AS evaluations
+            ON evaluations.file_id = best.file_id
+            AND evaluations.generation = best.generation
+            AND evaluations.metric = 'Evaluations'
+        WHERE best.value >= ?
+            AND (? IS NULL OR best.experiment = ?)
+        GROUP BY best.experiment, best.trial
+        ORDER BY best.experiment, Evaluations
+    """
+    return pd.read_sql_query(query, con, params=(target, experiment, experiment))
+
+
+def load(con: sqlite3.Connection, kind: str, experiment: str) -> pd.DataFrame:
+    # Rebuild the wide table (one row per generation/individual and trial)
+    table, csv_index, table_index = KINDS[kind]
+    query = f"""
+        SELECT trial AS Trial, {table_index} AS "{csv_index}", metric, value
+        FROM {table}
+        WHERE experiment = ?
+    """
+    df = pd.read_sql_query(query, con, params=(experiment,))
+    df = df.pivot_table(
+        index=["Trial", csv_index], columns="metric", values="value", sort=False
+    )
+    df.columns.name = None
+    return df.reset_index()
+
+
+def main():
+    arg_parser = ArgumentParser("Ingest WMR experiment outputs into a SQLite store.")
+
+    arg_parser.add_argument("data_dirs", type=str, nargs="*")
+    arg_parser.add_argument("--db", type=str, default="experiments.sqlite")
+    arg_parser.add_argument("--experiment", type=str, default=None)
+    arg_parser.add_argument("--best", action="store_true")
+    arg_parser.add_argument("--target", type=float, default=None)
+
+    args = arg_parser.parse_args()
+
+    con = connect(args.db)
+
+    for data_dir in args.data_dirs:
+        experiment = args.experiment or Path(data_dir).resolve().name
+        num_ingested, num_removed = ingest(con, data_dir, experiment)
+        print(
+            f"{data_dir}: ingested {num_ingested} file(s) into '{experiment}'"
+            f" and removed {num_removed} deleted file(s)"
+        )
+
+    if args.best:
+        print(best_objective_per_generation(con, args.experiment).to_string())
+
+    if args.target is not None:
+        df = evaluations_to_target(con, args.target, args.experiment)
+        print(df.to_string())
+
+    con.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+from collections import namedtuple
+from functools import lru_cache
+from math import ceil, floor, inf
+from random import Random
+
+from Box2D import b2Body, b2ChainShape, b2World
+
+# Long courses are generated from a seed one fixed-length chunk at a time.
+# Each chunk is a chain of ground vertices (flat, with step-up/step-down
+# platforms) that starts and ends at y = 0 so that chunks join seamlessly, and
+# the chunk holding the end of the course also has the wall. Chunks are pure
+# functions of (seed, index), so only those in a window around the robot need
+# to exist as static bodies in the world.
+
+Position = tuple[float, float]
+Segment = tuple[Position, Position]
+
+# Platforms are (x_start, x_end, height)
+Chunk = namedtuple("Chunk", ["index", "vertices", "platforms", "walls"])
+
+CHUNK_LENGTH = 10
+
+# Flat ground where the robot starts and in front of the wall
+START_CLEARANCE = 8
+END_CLEARANCE = 8
+
+PLATFORM_LENGTH = (1, 3)
+PLATFORM_GAP = (2, 6)
+# Fraction of the obstacle height
+PLATFORM_HEIGHT = (0.5, 1)
+
+MAX_CHUNK_PLATFORMS = ceil(CHUNK_LENGTH / (PLATFORM_LENGTH[0] + PLATFORM_GAP[0]))
+
+# Chunks are kept in the world this far behind and ahead of the chassis (the
+# distance sensor looks ahead)
+STREAM_BEHIND = 5
+STREAM_AHEAD = 20
+
+CHUNK_CACHE_SIZE = 64
+
+
+class Terrain:
+    def __init__(
+        self,
+        seed: int,
+        course_length: float,
+        obstacle_height: float,
+        wall_height: float,
+    ):
+        self.seed = seed
+        self.course_length = course_length
+        self.obstacle_height = obstacle_height
+        self.wall_height = wall_height
+
+        self.chunk = lru_cache(maxsize=CHUNK_CACHE_SIZE)(self.generate)
+
+    def chunk_index(self, x: float) -> int:
+        return floor(x / CHUNK_LENGTH)
+
+    def generate(self, index: int) -> Chunk:
+        x0 = index * CHUNK_LENGTH
+        x1 = x0 + CHUNK_LENGTH
+
+        # Platforms are only placed between the clearances
+        lo = max(x0, START_CLEARANCE)
+        hi = min(x1, self.course_length - END_CLEARANCE)
+
+        rng = Random(f"{self.seed}-{index}")
+        platforms = []
+
+        # Half a gap at each end of the chunk keeps platforms apart across chunks
+        start = x0 + rng.uniform(*PLATFORM_GAP) / 2
+        while True:
+            end = start + rng.uniform(*PLATFORM_LENGTH)
+            if end > x1 - PLATFORM_GAP[0] / 2:
+                break
+            height = rng.uniform(*PLATFORM_HEIGHT) * self.obstacle_height
+            if lo <= start and end <= hi:
+                platforms.append((start, end, height))
+            start = end + rng.uniform(*PLATFORM_GAP)
+
+        vertices = [(x0, 0.0)]
+        for start, end, height in platforms:
+            vertices += [(start, 0.0), (start, height), (end, height), (end, 0.0)]
+
+        # Chains need at least three vertices
+        if not platforms:
+            vertices.append(((x0 + x1) / 2, 0.0))
+        vertices.append((x1, 0.0))
+
+        walls = []
+        if x0 <= self.course_length < x1:
+            walls.append(
+                ((self.course_length, 0.0), (self.course_length, self.wall_height))
+            )
+
+        return Chunk(index, vertices, platforms, walls)
+
+    def chunks(self, x_lo: float, x_hi: float) -> list[Chunk]:
+        first, last = self.chunk_index(x_lo), self.chunk_index(x_hi)
+        return [self.chunk(index) for index in range(first, last + 1)]
+
+    def segments(
+        self, x_lo: float, x_hi: float, y_lo: float = -inf, y_hi: float = inf
+    ) -> list[Segment]:
+        # Ground and wall segments overlapping the box
+        return [
+            (p, q)
+            for chunk in self.chunks(x_lo, x_hi)
+            for p, q in chunk.walls + list(zip(chunk.vertices, chunk.vertices[1:]))
+            if min(p[0], q[0]) <= x_hi
+            and max(p[0], q[0]) >= x_lo
+            and min(p[1], q[1]) <= y_hi
+            and max(p[1], q[1]) >= y_lo
+        ]
+
+    def edges(self, x_lo: float, x_hi: float) -> list[float]:
+        # Positions of the vertical segments (platform sides and the wall)
+        return [p[0] for p, q in self.segments(x_lo, x_hi) if p[0] == q[0]]
+
+    def platforms(self, x_lo: float, x_hi: float) -> list[tuple[float, float, float]]:
+        return [
+            platform
+            for chunk in self.chunks(x_lo, x_hi)
+            for platform in chunk.platforms
+        ]
+
+
+class TerrainStreamer:
+    def __init__(self, world: b2World, terrain: Terrain, friction: float):
+        self.world = world
+        self.terrain = terrain
+        self.friction = friction
+
+        # Chunk index -> static bodies (ground chain and wall)
+        self.bodies: dict[int, list[b2Body]] = {}
+        self.window = (0, -1)
+
+    @staticmethod
+    def max_chunks() -> int:
+        # Most chunks that are ever streamed in at once
+        return ceil((STREAM_BEHIND + STREAM_AHEAD) / CHUNK_LENGTH) + 1
+
+    def extent(self) -> tuple[float, float]:
+        first, last = self.window
+        return first * CHUNK_LENGTH, (last + 1) * CHUNK_LENGTH
+
+    def update(self, x: float):
+        first = self.terrain.chunk_index(x - STREAM_BEHIND)
+        last = self.terrain.chunk_index(x + STREAM_AHEAD)
+
+        if (first, last) == self.window:
+            return
+
+        for index in [i for i in self.bodies if not first <= i <= last]:
+            for body in self.bodies.pop(index):
+                self.world.DestroyBody(body)
+
+        for index in range(first, last + 1):
+            if index not in self.bodies:
+                self.bodies[index] = self.create_bodies(self.terrain.chunk(index))
+
+        self.window = (first, last)
+
+    def create_bodies(self, chunk: Chunk) -> list[b2Body]:
+        ground = self.world.CreateStaticBody(userData="ground")
+
+        # The neighboring chunks are flat where they join (ghost vertices stop
+        # the wheels from catching on the seams)
+        shape = b2ChainShape(vertices_chain=chunk.vertices)
+        shape.SetPrevVertex((chunk.vertices[0][0] - 1, 0))
+        shape.SetNextVertex((chunk.vertices[-1][0] + 1, 0))
+        ground.CreateFixture(shape=shape, friction=self.friction)
+
+        bodies = [ground]
+
+        for wall_base, wall_top in chunk.walls:
+            wall = self.world.CreateStaticBody(userData="wall")
+            wall.CreateEdgeFixture(vertices=[wall_base, wall_top])
+            bodies.append(wall)
+
+        return bodies
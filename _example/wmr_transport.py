@@ -0,0 +1,112 @@
+from collections import deque
+from multiprocessing import shared_memory
+from pathlib import Path
+
+import numpy as np
+
+# Trajectories are written by worker processes straight into fixed-shape
+# float32 blocks (one per simulation run) so that only a small handle and the
+# block indices have to be pickled. Blocks live either in shared memory or in
+# a memory-mapped .npy file (which also keeps them on disk for analysis).
+
+FIELDS = ["distance", "speed", "contact", "impulse", "location"]
+
+Handle = tuple[str, str, tuple[int, int, int]]
+
+
+def attach_shared_memory(name: str) -> shared_memory.SharedMemory:
+    # Only the creating process should unlink the block (before Python 3.13
+    # workers share the parent's resource tracker, so attaching is harmless)
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        return shared_memory.SharedMemory(name=name)
+
+
+class TrajectoryRing:
+    def __init__(
+        self,
+        handle: Handle,
+        array: np.ndarray,
+        shm: shared_memory.SharedMemory | None = None,
+    ):
+        self.handle = handle
+        self.array = array
+        self.shm = shm
+        self.free = deque(range(len(array)))
+
+    @classmethod
+    def create(
+        cls, num_blocks: int, num_steps: int, path: str | Path | None = None
+    ) -> "TrajectoryRing":
+        shape = (num_blocks, len(FIELDS), num_steps)
+
+        if path is None:
+            size = int(np.prod(shape)) * np.dtype(np.float32).itemsize
+            shm = shared_memory.SharedMemory(create=True, size=size)
+            array = np.ndarray(shape, dtype=np.float32, buffer=shm.buf)
+            ring = cls(("shm", shm.name, shape), array, shm)
+        else:
+            array = np.lib.format.open_memmap(
+                path, mode="w+", dtype=np.float32, shape=shape
+            )
+            ring = cls(("file", str(path), shape), array)
+
+        # Missing values (e.g., infeasible individuals) are NaN
+        ring.array.fill(np.nan)
+        return ring
+
+    @classmethod
+    def attach(cls, handle: Handle) -> "TrajectoryRing":
+        kind, name, shape = handle
+
+        if kind == "file":
+            return cls(handle, np.load(name, mmap_mode="r+"))
+
+        shm = attach_shared_memory(name)
+        array = np.ndarray(shape, dtype=np.float32, buffer=shm.buf)
+        return cls(handle, array, shm)
+
+    def acquire(self) -> int:
+        if not self.free:
+            raise IndexError("No free trajectory blocks (release some first)")
+        return self.free.popleft()
+
+    def release(self, index: int):
+        self.array[index] = np.nan
+        self.free.append(index)
+
+    def write(self, index: int, sim_info: dict):
+        for row, field in zip(self.array[index], FIELDS):
+            values = sim_info.get(field) or []
+            row[: len(values)] = values[: len(row)]
+
+    def view(self, index: int) -> np.ndarray:
+        # Shape (len(FIELDS), num_steps), no copy
+        return self.array[index]
+
+    def field(self, index: int, field: str) -> np.ndarray:
+        return self.array[index, FIELDS.index(field)]
+
+    def close(self):
+        if isinstance(self.array, np.memmap):
+            self.array.flush()
+
+        # Views into the buffer must be gone before the shared memory closes
+        self.array = np.empty((0, len(FIELDS), 0), dtype=np.float32)
+        if self.shm:
+            self.shm.close()
+
+    def unlink(self):
+        if self.shm:
+            self.shm.unlink()
+
+
+# Rings attached by this (worker) process, reused across tasks
+_attached: dict[Handle, TrajectoryRing] = {}
+
+
+def attached(handle: Handle) -> TrajectoryRing:
+    if handle not in _attached:
+        _attached[handle] = TrajectoryRing.attach(handle)
+    return _attached[handle]
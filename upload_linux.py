@@ -1,22 +1,302 @@
-from os import environ
+import errno
+import hashlib
+import json
+import shutil
+import threading
+import time
+from argparse import ArgumentParser
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import partial
+from os import environ, replace
+from pathlib import Path, PurePosixPath
 
-from smbclient import listdir, register_session
+# Incremental deploy of the rendered site. Local files are hashed and compared
+# against a manifest kept next to the remote copy, so only changed files are
+# uploaded (by several workers, each with its own SMB session) and files that
+# are no longer part of the site are removed. The manifest is written last and
+# only lists files that made it, so a failed deploy is finished by the next one.
 
-pword = environ.get("WELLS_PASS")
+ROOT_DIR = r"\\WellsAF\Fac-Staff\ajcd2020"
+WEB_DIR = ROOT_DIR + r"\My Document\My Webs"
+DEV_DIR = WEB_DIR + r"\tutorials\simer\dev"
 
-root_dir = r"\\WellsAF\Fac-Staff\ajcd2020"
-web_dir = root_dir + r"\My Document\My Webs"
-dev_dir = web_dir + r"\tutorials\simer\dev"
+USERNAME = "ajcd2020"
 
-register_session(root_dir, username="ajcd2020", password=pword)
+SITE_DIR = Path(__file__).parent / "_site"
 
-for f in listdir(root_dir):
-    print(f)
+MANIFEST_NAME = ".manifest.json"
 
-for f in listdir(web_dir):
-    print(f)
+CHUNK_SIZE = 1 << 20
+RETRY_DELAY = 1
 
-for f in listdir(dev_dir):
-    print(f)
+# Relative POSIX path -> SHA-256 of the contents
+Manifest = dict[str, str]
 
-print('done')
\ No newline at end of file
+
+def hash_file(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def hash_tree(site_dir: Path, workers: int) -> Manifest:
+    paths = sorted(path for path in site_dir.rglob("*") if path.is_file())
+    with ThreadPoolExecutor(workers) as executor:
+        digests = executor.map(hash_file, paths)
+    return {
+        path.relative_to(site_dir).as_posix(): digest
+        for path, digest in zip(paths, digests)
+    }
+
+
+def is_missing(error: OSError) -> bool:
+    return isinstance(error, FileNotFoundError) or error.errno == errno.ENOENT
+
+
+class LocalBackend:
+    # A plain directory (a stand-in for the share when testing, or a mount)
+
+    def __init__(self, root: str):
+        self.root = Path(root)
+        self.retry_exceptions: tuple = (OSError,)
+
+    def path(self, name: str) -> Path:
+        return self.root / PurePosixPath(name)
+
+    def read_bytes(self, name: str) -> bytes | None:
+        try:
+            return self.path(name).read_bytes()
+        except FileNotFoundError:
+            return None
+
+    def write_bytes(self, name: str, data: bytes):
+        path = self.path(name)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(data)
+
+    def upload(self, local_path: Path, name: str):
+        # Replace the file in one go so that readers never see partial files
+        path = self.path(name)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        part_path = path.with_name(path.name + ".part")
+        shutil.copyfile(local_path, part_path)
+        replace(part_path, path)
+
+    def remove(self, name: str):
+        self.path(name).unlink(missing_ok=True)
+
+    def close(self):
+        pass
+
+
+class SMBBackend:
+    def __init__(self, root: str, username: str, password: str | None):
+        # Only needed for SMB destinations (pip install smbprotocol)
+        import smbclient
+        from smbprotocol.exceptions import SMBException
+
+        self.smbclient = smbclient
+        self.retry_exceptions: tuple = (OSError, SMBException)
+
+        self.root = root.rstrip("\\")
+        self.username = username
+        self.password = password
+
+        # Each worker thread gets its own connection cache (and so session)
+        self.local = threading.local()
+        self.caches: list[dict] = []
+
+        self.lock = threading.Lock()
+        self.made_dirs: set[str] = set()
+
+    def path(self, name: str) -> str:
+        return self.root + "\\" + name.replace("/", "\\")
+
+    def session(self) -> dict:
+        if not hasattr(self.local, "cache"):
+            self.local.cache = {}
+            with self.lock:
+                self.caches.append(self.local.cache)
+        return {
+            "connection_cache": self.local.cache,
+            "username": self.username,
+            "password": self.password,
+        }
+
+    def makedirs(self, name: str):
+        directory = self.path(name).rpartition("\\")[0]
+        with self.lock:
+            if directory in self.made_dirs:
+                return
+        self.smbclient.makedirs(directory, exist_ok=True, **self.session())
+        with self.lock:
+            self.made_dirs.add(directory)
+
+    def read_bytes(self, name: str) -> bytes | None:
+        try:
+            with self.smbclient.open_file(
+                self.path(name), mode="rb", **self.session()
+            ) as f:
+                return f.read()
+        except OSError as error:
+            if is_missing(error):
+                return None
+            raise
+
+    def write_bytes(self, name: str, data: bytes):
+        self.makedirs(name)
+        with self.smbclient.open_file(
+            self.path(name), mode="wb", **self.session()
+        ) as f:
+            f.write(data)
+
+    def upload(self, local_path: Path, name: str):
+        self.makedirs(name)
+        with (
+            open(local_path, "rb") as src,
+            self.smbclient.open_file(
+                self.path(name), mode="wb", **self.session()
+            ) as dst,
+        ):
+            shutil.copyfileobj(src, dst, CHUNK_SIZE)
+
+    def remove(self, name: str):
+        try:
+            self.smbclient.remove(self.path(name), **self.session())
+        except OSError as error:
+            if not is_missing(error):
+                raise
+
+    def close(self):
+        for cache in self.caches:
+            self.smbclient.reset_connection_cache(connection_cache=cache)
+
+
+Backend = LocalBackend | SMBBackend
+
+
+def retry(func, backend: Backend, retries: int):
+    for attempt in range(retries + 1):
+        try:
+            return func()
+        except backend.retry_exceptions as error:
+            if attempt == retries:
+                raise
+            print(f"Retrying ({attempt + 1}/{retries}) after: {error}")
+            time.sleep(RETRY_DELAY * 2**attempt)
+
+
+def deploy(
+    site_dir: Path,
+    backend: Backend,
+    workers: int,
+    retries: int,
+    full: bool = False,
+    dry_run: bool = False,
+) -> int:
+    local = hash_tree(site_dir, workers)
+
+    data = retry(lambda: backend.read_bytes(MANIFEST_NAME), backend, retries)
+    remote: Manifest = {} if data is None else json.loads(data)
+
+    # A full deploy re-uploads everything but still removes stale files
+    changed = [
+        name for name, digest in local.items() if full or remote.get(name) != digest
+    ]
+    stale = [name for name in remote if name not in local]
+
+    print(
+        f"{len(local)} file(s): {len(changed)} to upload,"
+        f" {len(stale)} to remove, {len(local) - len(changed)} unchanged"
+    )
+
+    if dry_run:
+        for name in changed:
+            print(f"upload {name}")
+        for name in stale:
+            print(f"remove {name}")
+        return 0
+
+    if not changed and not stale:
+        return 0
+
+    # Changed files are dropped from the manifest until they are uploaded and
+    # stale files stay in it until they are removed
+    manifest = {
+        name: digest
+        for name, digest in remote.items()
+        if name not in local or (not full and local[name] == digest)
+    }
+    num_failed = 0
+
+    def run(action: str, func, names: list[str]):
+        nonlocal num_failed
+        with ThreadPoolExecutor(workers) as executor:
+            futures = {
+                executor.submit(retry, partial(func, name), backend, retries): name
+                for name in names
+            }
+            for future in as_completed(futures):
+                name = futures[future]
+                try:
+                    future.result()
+                except backend.retry_exceptions as error:
+                    print(f"FAILED to {action} {name}: {error}")
+                    num_failed += 1
+                    continue
+
+                print(f"{action} {name}")
+                if action == "upload":
+                    manifest[name] = local[name]
+                else:
+                    del manifest[name]
+
+    # Upload before removing so that pages never link to removed files
+    run("upload", lambda name: backend.upload(site_dir / name, name), changed)
+    run("remove", backend.remove, stale)
+
+    data = json.dumps(dict(sorted(manifest.items())), indent=1).encode()
+    retry(lambda: backend.write_bytes(MANIFEST_NAME, data), backend, retries)
+
+    return num_failed
+
+
+def main():
+    arg_parser = ArgumentParser("Upload changed files of the rendered site.")
+
+    arg_parser.add_argument("--site", type=str, default=str(SITE_DIR))
+    arg_parser.add_argument("--dest", type=str, default=DEV_DIR)
+    arg_parser.add_argument("--workers", type=int, default=8)
+    arg_parser.add_argument("--retries", type=int, default=3)
+    arg_parser.add_argument("--full", action="store_true")
+    arg_parser.add_argument("--dry_run", action="store_true")
+
+    args = arg_parser.parse_args()
+
+    # UNC paths (\\server\share\...) go over SMB, anything else is a directory
+    if args.dest.startswith("\\\\"):
+        backend = SMBBackend(args.dest, USERNAME, environ.get("WELLS_PASS"))
+    else:
+        backend = LocalBackend(args.dest)
+
+    start = time.perf_counter()
+    try:
+        num_failed = deploy(
+            Path(args.site),
+            backend,
+            args.workers,
+            args.retries,
+            args.full,
+            args.dry_run,
+        )
+    finally:
+        backend.close()
+
+    print(f"done in {time.perf_counter() - start:.1f}s ({num_failed} failed)")
+    raise SystemExit(1 if num_failed else 0)
+
+
+if __name__ == "__main__":
+    main()